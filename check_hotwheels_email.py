@@ -1,12 +1,27 @@
+import asyncio
+import atexit
+import hashlib
 import json
 import os
 import sys
+import time
+import shutil
+import ssl
 import smtplib
 from email.message import EmailMessage
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
+from html import escape as html_escape
+from pathlib import Path
+from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
+import httpx
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, async_playwright
+
+try:
+    import orjson # Rust-backed; several times faster than stdlib json both ways
+except ImportError:
+    orjson = None # Fall back to stdlib json
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 1) CONFIGURATION / CONSTANTS
@@ -14,12 +29,92 @@ from playwright.sync_api import sync_playwright
 
 URL = "https://www.toymarche.com/brand/hot-wheels"
 PREVIOUS_FILE = "previous.json"
+# API validators from the last run: HTTP validators + a hash of the API body.
+# Kept out of PREVIOUS_FILE because they can change on every run; this file is
+# gitignored and carried between CI runs by actions/cache, so refreshing it
+# never produces a commit.
+VALIDATORS_FILE = "api_validators.json"
+VALIDATOR_KEYS = ("etag", "last_modified", "hash")
+
+# JSON endpoint the AngularJS product grid loads its data from. When set, the
+# browser is skipped entirely; if empty or the response shape changes, we fall
+# back to rendering URL with Playwright. May be absolute, "//host/..." or "/path"
+# (resolved against URL once here rather than on every request).
+_API_PATH  = os.getenv("TOYMARCHE_API_URL", "")  # e.g. "/api/products?brand=hot-wheels"
+API_URL    = urljoin(URL, _API_PATH) if _API_PATH else ""
+NOT_MODIFIED = object() # Returned by fetch_api_products (in place of names) when the list is known to be unchanged
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+# Persistent Chromium profile: keeps the HTTP/JS caches warm between runs
+# (restored/saved by actions/cache in CI) so we don't cold-start every time.
+PROFILE_DIR = "/tmp/pw_profile"
+PROFILE_MAX_AGE = 7 * 24 * 3600 # Start from a fresh profile weekly so caches/cruft don't pile up
+CHROMIUM_ARGS = [
+    "--disable-gpu",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-features=Translate,MediaRouter,BackForwardCache",
+    "--blink-settings=imagesEnabled=false", # Images are never fetched or decoded
+    "--mute-audio",
+]
+
+# Requests the product list doesn't need (Angular only needs document/JS/XHR).
+# CDP URL wildcards; images are already off via imagesEnabled=false above.
+BLOCKED_URL_PATTERNS = [
+    "*.css*", "*.woff*", "*.ttf*", "*.otf*", "*.eot*", "*.mp4*", "*.webm*",
+    "*googletagmanager*", "*google-analytics*", "*facebook*", "*hotjar*",
+]
+
+def _xpath_class(name: str) -> str:
+    """XPath 1.0 test for "has CSS class `name`" (exact token, not substring)."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Both selectors are built once here from the same class list, so the readiness
+# check and the extraction can't drift apart.
+PRODUCT_NAME_CLASSES = ("product-name", "ng-binding")
+PRODUCT_NAME_SELECTOR = "a" + "".join(f".{cls}" for cls in PRODUCT_NAME_CLASSES)
+# One XPath, evaluated by the browser's native engine, that picks every
+# <div class="product-grid-item"> whose <div class="caption"> has no
+# <div class="out-of-stock"> (i.e. not sold out); the name anchor is then
+# looked up inside each one with PRODUCT_NAME_SELECTOR.
+AVAILABLE_ITEM_XPATH = (
+    f"//div[{_xpath_class('product-grid-item')}]"
+    f"[not(.//div[{_xpath_class('caption')}]//div[{_xpath_class('out-of-stock')}])]"
+)
+# Polled by wait_for_function: null until Angular has rendered any product name,
+# then {names, missing}: the available names (possibly empty) and how many
+# available grid items had no (or an empty) name anchor, so waiting, extracting
+# and sanity-checking share one pass over the DOM.
+PRODUCT_NAMES_JS = """
+([selector, xpath]) => {
+    if (!document.querySelector(selector)) return null;
+    const snap = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const names = [];
+    for (let i = 0; i < snap.snapshotLength; i++) {
+        const anchor = snap.snapshotItem(i).querySelector(selector);
+        const name = anchor ? anchor.textContent.trim() : "";
+        if (name) names.push(name);
+    }
+    return {names, missing: snap.snapshotLength - names.length};
+}
+"""
 
 # Gmail SMTP (from GitHub Secrets)
+SMTP_HOST          = "smtp.gmail.com"
+SMTP_PORT          = 465
 GMAIL_USER         = os.getenv("GMAIL_USER", "")         # e.g. "your.email@gmail.com"
 GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD", "") # the 16-char App Password
 EMAIL_TO           = os.getenv("EMAIL_TO", "")           # where you want the notification (comma-separated for multiple)
 
+# Derived once at import; they don't change between sends
+EMAIL_RECIPIENTS = [email.strip() for email in EMAIL_TO.split(',') if email.strip()]
+EMAIL_FROM       = f"Hot Wheels Notifier <{GMAIL_USER}>"
+
 # Banner image URL (hosted online somewhere, or you can replace with your own)
 BANNER_URL = "https://shop.mattel.com.au/cdn/shop/files/Poster_Thumbnail.png?v=1710824118&width=1100"  # example Hot Wheels banner (replace if you want)
 
@@ -27,126 +122,347 @@ BANNER_URL = "https://shop.mattel.com.au/cdn/shop/files/Poster_Thumbnail.png?v=1
 # 2) HELPERS: Fetch + Parse
 # ─────────────────────────────────────────────────────────────────────────────
 
-def fetch_rendered_html() -> str:
+def fetch_api_products(validators: dict[str, str]):
+    """
+    Fetch the product list straight from the JSON API behind the page (no browser).
+    validators are the "etag" / "last_modified" / "hash" saved by the previous run:
+    the first two make the request conditional (an unchanged list costs a body-less
+    304), the last catches servers that don't support that by hashing the body.
+    Return (available names, new validators), (NOT_MODIFIED, new validators) if
+    the list is known to be unchanged, or None if API_URL isn't configured or the
+    request/response doesn't look as expected (caller falls back to Playwright).
+    """
+    if not API_URL:
+        return None
+    headers = {"User-Agent": USER_AGENT}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    try:
+        # HTTP/2 (via h2): single multiplexed TLS connection, compressed headers
+        with httpx.Client(http2=True, timeout=20, follow_redirects=True) as client:
+            r = client.get(API_URL, headers=headers)
+        if r.status_code == 304:
+            return NOT_MODIFIED, validators
+        r.raise_for_status()
+        # Keep the server's current ETag/Last-Modified even when the body is the
+        # same, so a rotated ETag can still earn a 304 next time
+        new_validators = {
+            "etag": r.headers.get("ETag", ""),
+            "last_modified": r.headers.get("Last-Modified", ""),
+            "hash": _digest(r.content),
+        }
+        # Same bytes as last time: skip decoding and diffing entirely
+        if new_validators["hash"] == validators.get("hash"):
+            return NOT_MODIFIED, new_validators
+        # Decode with orjson (when installed) rather than httpx's stdlib-json r.json()
+        names = [p["name"] for p in _json_loads(r.content)["products"] if not p.get("outOfStock")]
+        return names, new_validators
+    except Exception as e:
+        print(f"⚠️ Warning: API fetch failed ({e}). Falling back to browser.")
+        return None
+
+async def _block_heavy_resources(context, page) -> None:
+    """
+    Tell Chromium (over CDP) to drop BLOCKED_URL_PATTERNS. Unlike Playwright's
+    route interception, this leaves the browser's HTTP cache switched on, so the
+    persistent profile's warm cache still gets used.
+    """
+    cdp = await context.new_cdp_session(page)
+    await cdp.send("Network.enable")
+    await cdp.send("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+
+def _expire_old_profile() -> bool:
+    """
+    Delete PROFILE_DIR once it's older than PROFILE_MAX_AGE. Age is tracked by a
+    marker file written when the profile is (re)created, since Chromium keeps
+    touching everything else inside it.
+    Return True if this run starts on a fresh (cold) profile.
+    """
+    marker = os.path.join(PROFILE_DIR, ".created")
+    try:
+        if os.path.exists(marker) and time.time() - os.path.getmtime(marker) > PROFILE_MAX_AGE:
+            print(f"  ↳ Browser profile older than {PROFILE_MAX_AGE // 86400} days. Starting fresh.")
+            shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+        if not os.path.exists(marker):
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            open(marker, "w").close()
+            return True
+    except OSError as e:
+        print(f"⚠️ Warning: Could not check browser profile age: {e}")
+    return False
+
+def _log_api_candidate(response) -> None:
+    """
+    Playwright response listener used while API_URL isn't configured: print the
+    JSON product XHRs Angular makes, so one can be set as TOYMARCHE_API_URL.
+    Only attached on a cold profile (first run, then weekly) to keep the hourly
+    logs quiet.
+    """
+    if "product" in response.url and "json" in response.headers.get("content-type", ""):
+        print(f"  ↳ Possible product API (set TOYMARCHE_API_URL to skip the browser): {response.url}")
+
+async def fetch_product_names_async() -> list[str] | None:
     """
-    Launch headless Chromium (Playwright), navigate to URL, wait for JS to load,
-    and return the fully-rendered HTML as a string.
+    Launch headless Chromium (async Playwright) on the persistent PROFILE_DIR, navigate
+    to URL, wait for JS to load, and extract product names ONLY for items NOT
+    marked as "Out Of Stock" inside the page (see AVAILABLE_ITEM_XPATH), so only a
+    short list of strings crosses back to Python instead of the whole DOM.
+    Return None on error.
     """
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
+    cold_profile = _expire_old_profile()
+    async with async_playwright() as p:
+        context = await p.chromium.launch_persistent_context(PROFILE_DIR, headless=True, args=CHROMIUM_ARGS)
+        page = context.pages[0] if context.pages else await context.new_page()
+        if not API_URL and cold_profile:
+            page.on("response", _log_api_candidate)
         try:
-            page.goto(URL, timeout=60000) # Increased timeout
-            # Wait longer and potentially for a specific element if needed
-            page.wait_for_timeout(7000)  # wait 7 sec for JS to populate
-            html = page.content()
+            await _block_heavy_resources(context, page)
+            # Don't wait for images/fonts ("load"); we only need the DOM + Angular's XHR
+            await page.goto(URL, wait_until="domcontentloaded", timeout=60000)
+            try:
+                # Return as soon as Angular has rendered the product names
+                handle = await page.wait_for_function(PRODUCT_NAMES_JS, arg=[PRODUCT_NAME_SELECTOR, AVAILABLE_ITEM_XPATH], timeout=15000)
+                result = await handle.json_value()
+                names = result["names"]
+                # Markup changes show up here instead of as a silently short list
+                if result["missing"]:
+                    print(f"⚠️ Warning: Found {result['missing']} product item(s) without a name anchor.")
+            except PlaywrightTimeoutError:
+                print("⚠️ Warning: No product names rendered within 15s.")
+                names = []
         except Exception as e:
             print(f"🚨 Error fetching page: {e}")
-            html = "" # Return empty string on error
+            names = None
         finally:
-            browser.close()
-    return html
-
-def parse_product_list(html: str) -> list[str]:
-    """
-    Given the rendered HTML, extract product names ONLY for items NOT marked as "Out Of Stock".
-    Products are in <div class="product-grid-item">.
-    Product name is in <a class="product-name ng-binding">.
-    Sold out items have a <div class="out-of-stock"> child within the <div class="caption">.
-    Return a list of available product names (strings).
-    """
-    if not html: # Handle case where fetching failed
-        return []
-    soup = BeautifulSoup(html, "html.parser")
-    # Select the main container for each product
-    product_items = soup.select("div.product-grid-item")
-    available_names = []
-    for item in product_items:
-        # Check if the 'out-of-stock' div exists within this product item's caption
-        # Check within the 'caption' div specifically, as 'out-of-stock' might appear elsewhere
-        caption_div = item.select_one("div.caption")
-        is_sold_out = caption_div and caption_div.select_one("div.out-of-stock")
-
-        if not is_sold_out:
-            # If not sold out, find the product name anchor within this item
-            name_anchor = item.select_one("a.product-name.ng-binding")
-            if name_anchor:
-                # Extract and add the name if found
-                name = name_anchor.get_text(strip=True)
-                available_names.append(name)
-            else:
-                print("⚠️ Warning: Found product item without a name anchor.") # Optional warning
-        #else:
-            # Optionally log skipped items
-            #name_anchor_sold_out = item.select_one("a.product-name.ng-binding")
-            #if name_anchor_sold_out:
-            #    print(f"  ↳ Skipping sold out: {name_anchor_sold_out.get_text(strip=True)}")
-
-    return available_names
+            await context.close()
+    return names
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 3) Compare to previous.json
 # ─────────────────────────────────────────────────────────────────────────────
 
-def load_previous_list() -> list[str]:
+def _json_loads(raw: bytes):
+    """
+    Decode JSON bytes with orjson when available, else stdlib json.
+    Both raise a json.JSONDecodeError (sub)class on bad input.
+    """
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def _json_dumps(obj) -> bytes:
+    """
+    Encode obj as 2-space indented UTF-8 JSON bytes (same layout either way).
+    """
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+def _digest(raw: bytes) -> str:
+    """
+    Short BLAKE2b hex digest of raw bytes, used to spot identical content cheaply.
     """
-    Load the JSON file that holds the previously-seen product names.
-    If missing or invalid, return an empty list.
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+@lru_cache(maxsize=4)
+def _read_previous_file(path: str, mtime_ns: int) -> frozenset[str] | None:
     """
+    Read + decode `path` once per (path, mtime) so repeated checks in the same
+    process skip the disk read and JSON parse while the file is unchanged.
+    Return the items, or None if they aren't a list of strings. The result is
+    immutable, so the cached value is safe to hand out as-is.
+    """
+    data = _json_loads(Path(path).read_bytes())
+    # Some runs stored {"items": [...], <validators>}; validators now live in VALIDATORS_FILE
+    if isinstance(data, dict):
+        data = data.get("items")
+    # Ensure loaded data is a list of strings
+    if isinstance(data, list) and all(isinstance(item, str) for item in data):
+        return frozenset(data)
+    return None
+
+def _items_digest(items) -> str:
+    """
+    Order-independent digest of an item set; ties VALIDATORS_FILE to the
+    PREVIOUS_FILE contents it was saved alongside.
+    """
+    return _digest("\n".join(sorted(items)).encode("utf-8"))
+
+def _load_validators(items: frozenset[str]) -> dict[str, str]:
+    """
+    Load the API validators (VALIDATOR_KEYS) saved by the last run. They're
+    ignored ("" for every key) if VALIDATORS_FILE is missing, unreadable, or was
+    saved for a different item set than `items` (e.g. previous.json came from a
+    commit that never got pushed), since a 304/hash hit would otherwise pin the
+    wrong list.
+    """
+    empty = dict.fromkeys(VALIDATOR_KEYS, "")
+    if not items or not os.path.exists(VALIDATORS_FILE):
+        return empty
+    try:
+        data = _json_loads(Path(VALIDATORS_FILE).read_bytes())
+        if not isinstance(data, dict) or data.get("items") != _items_digest(items):
+            return empty
+        return {key: data.get(key) or "" for key in VALIDATOR_KEYS}
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load '{VALIDATORS_FILE}': {e}. Ignoring it.")
+        return empty
+
+def load_previous_state() -> tuple[frozenset[str], dict[str, str]]:
+    """
+    Load the JSON file that holds the previously-seen product names as a set
+    (it's only used for membership/diffing, never mutated or re-ordered), plus
+    the API validators that go with them (see _load_validators).
+    If missing or invalid, return an empty set and empty validators.
+    """
+    items = frozenset()
     if not os.path.exists(PREVIOUS_FILE):
-        return []
+        return items, _load_validators(items)
     try:
-        with open(PREVIOUS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            # Ensure loaded data is a list of strings
-            if isinstance(data, list) and all(isinstance(item, str) for item in data):
-                return data
-            else:
-                print(f"⚠️ Warning: '{PREVIOUS_FILE}' content is not a list of strings. Resetting.")
-                return []
+        data = _read_previous_file(PREVIOUS_FILE, os.stat(PREVIOUS_FILE).st_mtime_ns)
+        if data is None:
+            print(f"⚠️ Warning: '{PREVIOUS_FILE}' content is not a list of strings. Resetting.")
+        else:
+            items = data
     except json.JSONDecodeError:
         print(f"🚨 Error: Could not decode JSON from '{PREVIOUS_FILE}'. Resetting.")
-        return []
     except Exception as e:
         print(f"🚨 Error loading '{PREVIOUS_FILE}': {e}. Resetting.")
-        return []
+    return items, _load_validators(items)
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """
+    Write + fsync a temp file and rename it over `path`, so a crash mid-write
+    can't leave a truncated file behind. Raises on failure.
+    """
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno()) # Make sure the bytes are on disk before the rename publishes them
+    os.replace(tmp_file, path) # Atomic on POSIX and Windows
 
 def save_current_list(current: list[str]) -> None:
     """
     Overwrite previous.json with the new list so next run only sees newer items.
+    (main_async already skips calling this when the items are unchanged.)
     """
     try:
-        with open(PREVIOUS_FILE, "w", encoding="utf-8") as f:
-            json.dump(current, f, ensure_ascii=False, indent=2)
+        _write_atomic(PREVIOUS_FILE, _json_dumps(current))
     except Exception as e:
         print(f"🚨 Error saving current list to '{PREVIOUS_FILE}': {e}")
 
+def save_validators(items, validators: dict[str, str]) -> None:
+    """
+    Overwrite VALIDATORS_FILE with the API validators from this run, tagged with
+    the item set they describe. Cheap to do every run: the file isn't committed.
+    """
+    state = {"items": _items_digest(items), **{key: validators.get(key, "") for key in VALIDATOR_KEYS}}
+    try:
+        _write_atomic(VALIDATORS_FILE, _json_dumps(state))
+    except Exception as e:
+        print(f"⚠️ Warning: Could not save '{VALIDATORS_FILE}': {e}")
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 4) Send Email via Gmail SMTP (HTML version with banner)
 # ─────────────────────────────────────────────────────────────────────────────
 
-def send_email_alert(new_items: list[str]) -> None:
+# One logged-in SMTP connection per process, reused across sends (see _get_smtp)
+_SSL_CONTEXT = ssl.create_default_context() # Built once; loading the CA bundle isn't free
+_smtp: smtplib.SMTP_SSL | None = None
+
+def _close_smtp() -> None:
     """
-    Compose and send an HTML email listing all new_items with a banner.
-    Uses Gmail SMTP with an App Password.
+    Politely close the cached SMTP connection (if any) and forget it.
     """
-    if not (GMAIL_USER and GMAIL_APP_PASSWORD and EMAIL_TO):
-        print("🚨 Missing Gmail credentials or destination address. Cannot send email.")
+    global _smtp
+    if _smtp is None:
         return
+    try:
+        _smtp.quit()
+    except Exception:
+        _smtp.close() # Server already gone; just drop the socket
+    _smtp = None
 
-    # Split the comma-separated string from EMAIL_TO into a list of recipients
-    recipient_list = [email.strip() for email in EMAIL_TO.split(',') if email.strip()]
+atexit.register(_close_smtp) # QUIT the pooled connection once, when the process ends
 
-    if not recipient_list:
-        print("🚨 No valid recipient email addresses found in EMAIL_TO. Cannot send email.")
-        return
+def _get_smtp() -> smtplib.SMTP_SSL:
+    """
+    Return a logged-in Gmail SMTP_SSL connection. A connection from an earlier
+    send is reused if it still answers NOOP; otherwise reconnect and log in again,
+    so the TLS handshake + AUTH is paid once per process rather than once per send.
+    """
+    global _smtp
+    if _smtp is not None:
+        try:
+            if _smtp.noop()[0] == 250:
+                return _smtp
+        except (smtplib.SMTPException, OSError):
+            pass # Timed out / disconnected; reconnect below
+        _close_smtp()
 
-    subject = f"🏎️ [{len(new_items)}] New Hot Wheels Item(s) In Stock!" # Dynamic subject
+    smtp = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=_SSL_CONTEXT, timeout=30)
+    try:
+        smtp.login(GMAIL_USER, GMAIL_APP_PASSWORD)
+    except Exception:
+        smtp.close()
+        raise
+    _smtp = smtp
+    return smtp
+
+# Most mail clients strip onerror, so a dead banner shows as a broken image;
+# main_async HEAD-checks it (see _reachable_urls) before the email is built.
+BANNER_HTML = """<img src="{url}" alt="Hot Wheels Banner" class="banner" onerror="this.style.display='none'" /> <!-- Added onerror fallback -->"""
+
+async def _reachable_urls(urls: list[str], concurrency: int = 10) -> set[str]:
+    """
+    HEAD all urls concurrently (at most `concurrency` in flight, one HTTP/2
+    client) and return the ones that aren't definitely gone. Only connection
+    errors and 404/410 count as dead; plenty of CDNs answer HEAD with 403/405.
+    Never raises: if the check itself breaks (e.g. h2 isn't installed), every
+    url is kept, since a missing image must never block the alert.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(client: httpx.AsyncClient, url: str) -> str | None:
+        async with semaphore:
+            try:
+                r = await client.head(url)
+                return None if r.status_code in (404, 410) else url
+            except httpx.HTTPError:
+                return None
+
+    try:
+        async with httpx.AsyncClient(http2=True, timeout=5, follow_redirects=True) as client:
+            results = await asyncio.gather(*(check(client, url) for url in urls))
+    except Exception as e:
+        print(f"⚠️ Warning: Image URL check failed ({e}). Keeping all images.")
+        return set(urls)
+    return {url for url in results if url}
+
+def _prelogin_smtp() -> bool:
+    """
+    Open + log in the pooled SMTP connection ahead of time (run by main_async
+    while it checks the banner and builds the message). Return False only if
+    the credentials were rejected, so the send isn't attempted (and the login
+    repeated) for nothing; other failures are logged and the send reconnects.
+    """
+    if not (GMAIL_USER and GMAIL_APP_PASSWORD and EMAIL_RECIPIENTS):
+        return True # send_email_alert reports what's missing
+    try:
+        _get_smtp()
+    except smtplib.SMTPAuthenticationError:
+        print("🚨 SMTP Authentication Error: Check GMAIL_USER and GMAIL_APP_PASSWORD.")
+        return False
+    except Exception as e:
+        print(f"⚠️ Warning: SMTP pre-login failed ({e}). Retrying when sending.")
+    return True
 
-    # Build the HTML content
-    html_body = f"""
+# Email HTML, built once at import; build_email_message only fills in the blanks
+# with str.format (CSS braces are doubled so format leaves them alone).
+EMAIL_HTML_TEMPLATE = """
     <html>
     <head>
       <style>
@@ -216,55 +532,81 @@ def send_email_alert(new_items: list[str]) -> None:
     </head>
     <body>
       <div class="container">
-        <img src="{BANNER_URL}" alt="Hot Wheels Banner" class="banner" onerror="this.style.display='none'" /> <!-- Added onerror fallback -->
+        {banner}
         <div class="content">
           <h1>New Hot Wheels Cars Just Arrived!</h1>
           <p>Hey there,</p>
-          <p>The following {len(new_items)} new Hot Wheels car(s) have just appeared on ToyMarche and are currently listed as in stock:</p>
+          <p>The following {count} new Hot Wheels car(s) have just appeared on ToyMarche and are currently listed as in stock:</p>
           <ul>
-    """
-
-    # Sanitize item names before inserting into HTML to prevent potential issues
-    for name in new_items:
-        # Basic sanitization: escape HTML special characters
-        safe_name = name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        html_body += f"<li>{safe_name}</li>"
-
-    html_body += f"""
+    {items}
           </ul>
           <p>
-            <a href="{URL}" class="button" target="_blank">Check Them Out</a>
+            <a href="{url}" class="button" target="_blank">Check Them Out</a>
           </p>
           <p>Good luck grabbing them first!</p>
         </div>
       </div>
       <div class="footer">
-        Checked at {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')} | &copy; {datetime.utcnow().year} ToyMarche Hot Wheels Tracker
+        Checked at {now:%Y-%m-%d %H:%M:%S UTC} | &copy; {now.year} ToyMarche Hot Wheels Tracker
       </div>
     </body>
     </html>
     """
 
+def build_email_message(new_items: list[str], include_banner: bool = True) -> EmailMessage:
+    """
+    Compose the HTML email (with a plain-text fallback) listing all new_items,
+    with the banner unless include_banner is False (e.g. its URL is dead).
+    """
+    subject = f"🏎️ [{len(new_items)}] New Hot Wheels Item(s) In Stock!" # Dynamic subject
+
+    # Build the HTML content: escape each name and join the list items in one pass
+    items_html = "".join(f"<li>{html_escape(name)}</li>" for name in new_items)
+    html_body = EMAIL_HTML_TEMPLATE.format(
+        banner=BANNER_HTML.format(url=html_escape(BANNER_URL)) if include_banner else "",
+        count=len(new_items),
+        items=items_html,
+        url=URL,
+        now=datetime.now(timezone.utc), # One clock read for both footer fields
+    )
+
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = f"Hot Wheels Notifier <{GMAIL_USER}>" # Improve From header
-    msg["To"] = ", ".join(recipient_list) # Assign the joined list to the 'To' header
+    msg["From"] = EMAIL_FROM
+    msg["To"] = ", ".join(EMAIL_RECIPIENTS) # Assign the joined list to the 'To' header
     # Simple text fallback
-    text_fallback = f"Found {len(new_items)} new Hot Wheels item(s):\n\n" + "\n".join([f"- {name}" for name in new_items]) + f"\n\nCheck them out: {URL}"
+    items_text = "\n".join(f"- {name}" for name in new_items) # One join, then one format below
+    text_fallback = f"Found {len(new_items)} new Hot Wheels item(s):\n\n{items_text}\n\nCheck them out: {URL}"
     msg.set_content(text_fallback)
     # Add HTML alternative
     msg.add_alternative(html_body, subtype="html")
+    return msg
+
+def send_email_alert(msg: EmailMessage) -> None:
+    """
+    Send a message from build_email_message via Gmail SMTP with an App Password.
+    """
+    if not (GMAIL_USER and GMAIL_APP_PASSWORD and EMAIL_TO):
+        print("🚨 Missing Gmail credentials or destination address. Cannot send email.")
+        return
+
+    if not EMAIL_RECIPIENTS:
+        print("🚨 No valid recipient email addresses found in EMAIL_TO. Cannot send email.")
+        return
 
     try:
-        # Use context manager for SMTP connection
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-            smtp.send_message(msg) # send_message handles multiple recipients from msg["To"]
-        print(f"✅ Email alert sent successfully to {', '.join(recipient_list)}.")
+        try:
+            _get_smtp().send_message(msg) # Reuses a live connection from an earlier send, if any
+        except smtplib.SMTPServerDisconnected:
+            # Dropped between the NOOP check and the send: reconnect once and retry
+            _close_smtp()
+            _get_smtp().send_message(msg) # send_message handles multiple recipients from msg["To"]
+        print(f"✅ Email alert sent successfully to {', '.join(EMAIL_RECIPIENTS)}.")
     except smtplib.SMTPAuthenticationError:
         print("🚨 SMTP Authentication Error: Check GMAIL_USER and GMAIL_APP_PASSWORD.")
     except Exception as e:
         print(f"🚨 Failed to send email: {e}")
+        _close_smtp() # Don't hand a possibly-broken connection to the next send
         # Consider logging the full exception traceback here for debugging
         # import traceback
         # traceback.print_exc()
@@ -273,53 +615,80 @@ def send_email_alert(new_items: list[str]) -> None:
 # 5) MAIN LOGIC
 # ─────────────────────────────────────────────────────────────────────────────
 
-def main():
-    start_time = datetime.utcnow()
+async def main_async():
+    start_time = datetime.now(timezone.utc)
     print("="*60)
-    print(f"[{start_time.isoformat()}] Checking ToyMarche Hot Wheels…")
+    print(f"[{start_time.isoformat(timespec='seconds')}] Checking ToyMarche Hot Wheels…")
 
-    # 1) Load old list
-    prev_list_set = set(load_previous_list()) # Use a set for faster lookups
+    # 1) Load old list (+ API validators from the last run)
+    prev_list_set, prev_validators = load_previous_state() # Already a set; no list → set copy
     print(f"  ↳ Previously tracking {len(prev_list_set)} items.")
 
-    # 2) Fetch & parse current available items
-    html = fetch_rendered_html()
-    if not html:
-        print("🚨 Aborting check due to page fetch error.")
-        sys.exit(1) # Exit with an error code
+    # 2) Fetch & parse current available items (API first, browser as fallback)
+    api_result = fetch_api_products(prev_validators)
+    not_modified = api_result is not None and api_result[0] is NOT_MODIFIED
+    if not_modified:
+        # 304 / identical body: nothing changed server-side, so "current" is exactly what we had
+        print("  ↳ API reports no changes since the last check.")
+        current_list, validators = list(prev_list_set), api_result[1]
+    elif api_result is not None:
+        current_list, validators = api_result
+    else:
+        current_list, validators = await fetch_product_names_async(), dict.fromkeys(VALIDATOR_KEYS, "")
+        if current_list is None:
+            print("🚨 Aborting check due to page fetch error.")
+            sys.exit(1) # Exit with an error code
 
-    current_list = parse_product_list(html)
-    current_list_set = set(current_list) # Use a set
+    # Use a set (on a 304 the previous set *is* the current one; no rebuild)
+    current_list_set = prev_list_set if not_modified else set(current_list)
     print(f"  ↳ Currently found {len(current_list_set)} available items.")
 
     # 3) Compare: Find items in current that were not in previous
-    new_items = sorted(list(current_list_set - prev_list_set)) # Sort for consistent email order
+    new_items = sorted(current_list_set - prev_list_set) # Set difference (hashed lookups), sorted for consistent email order
+    # Nothing added + same size ⇒ same set; reuses the difference instead of a second full compare
+    unchanged = not new_items and len(current_list_set) == len(prev_list_set)
 
     if new_items:
         print(f"  ↳ Found {len(new_items)} new item(s):")
         for itm in new_items:
             print(f"      • {itm}")
 
-        # 4) Send email alert only if there are new items
-        send_email_alert(new_items)
+        # 4) Send email alert only if there are new items. The SMTP login runs in a
+        # worker thread while we check the banner and build the message.
+        smtp_task = asyncio.create_task(asyncio.to_thread(_prelogin_smtp))
+        # Only embed images that actually load (today that's just the banner)
+        reachable = await _reachable_urls([BANNER_URL])
+        msg = build_email_message(new_items, include_banner=BANNER_URL in reachable)
+        if await smtp_task:
+            send_email_alert(msg)
 
     else:
         print("  ↳ No new items found compared to the previous list. ✅")
 
     # 5) Save the *current* list (available items only) for the next run,
     # regardless of whether new items were found. This keeps the state updated.
-    if current_list: # Only save if the current list isn't empty (e.g., due to parse error)
+    if not current_list: # Only save if the current list isn't empty (e.g., due to parse error)
+        print(f"⚠️ Warning: Current available list is empty. Not updating '{PREVIOUS_FILE}'.")
+    elif unchanged:
+        # Same items as on disk: skip the rewrite (and the git diff in CI)
+        print(f"  ↳ Available items unchanged. Not rewriting '{PREVIOUS_FILE}'.")
+    else:
         print(f"  ↳ Saving current {len(current_list)} available items to '{PREVIOUS_FILE}'.")
         save_current_list(current_list)
-    else:
-        print(f"⚠️ Warning: Current available list is empty. Not updating '{PREVIOUS_FILE}'.")
+
+    # 6) Refresh the API validators whenever they moved (e.g. a price edit changes
+    # the body but not the items), so the 304 / same-hash fast path keeps working
+    if current_list and validators != prev_validators:
+        save_validators(current_list_set, validators)
 
 
-    end_time = datetime.utcnow()
+    end_time = datetime.now(timezone.utc)
     duration = end_time - start_time
-    print(f"[{end_time.isoformat()}] Check finished in {duration.total_seconds():.2f} seconds.")
+    print(f"[{end_time.isoformat(timespec='seconds')}] Check finished in {duration.total_seconds():.2f} seconds.")
     print("="*60)
-    sys.exit(0) # Ensure exit code 0 on success
+
+def main():
+    asyncio.run(main_async()) # Returning normally exits with code 0
 
 if __name__ == "__main__":
     main()